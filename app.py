@@ -1,346 +1,538 @@
-import streamlit as st
-import pandas as pd
-import pdfplumber
-import re
-import io
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-
-# --- PAGE CONFIG ---
-st.set_page_config(page_title="VW RTO Verifier", layout="wide")
-
-# --- HELPER FUNCTIONS ---
-
-def normalize_text(text):
-    if not text: return ""
-    text = re.sub(r'[^\w\s]', ' ', str(text))
-    return text.lower().strip()
-
-def check_name_match(excel_name, doc_name):
-    # Safe check: if excel_name is a Series (duplicate col), take the first one
-    if isinstance(excel_name, pd.Series):
-        excel_name = str(excel_name.iloc[0])
-    
-    if not doc_name or not excel_name:
-        return False
-    
-    clean_excel = normalize_text(excel_name)
-    clean_doc = normalize_text(doc_name)
-
-    excel_tokens = clean_excel.split()
-    doc_tokens = clean_doc.split()
-
-    matches = 0
-    for doc_word in doc_tokens:
-        if doc_word in excel_tokens:
-            matches += 1
-            continue
-        if len(doc_word) == 1:
-            if any(token.startswith(doc_word) for token in excel_tokens):
-                matches += 1
-                continue
-
-    if len(doc_tokens) > 0 and (matches / len(doc_tokens)) >= 0.5:
-        return True
-    return False
-
-def find_column_case_insensitive(columns, allowed_names):
-    """
-    Strict case-insensitive search.
-    Returns the actual column name from the dataframe if found.
-    """
-    allowed_lower = [name.lower().strip() for name in allowed_names]
-    
-    for col in columns:
-        if str(col).lower().strip() in allowed_lower:
-            return col
-    
-    return None
-
-def extract_text_from_pdf_upload(uploaded_file):
-    text_content = ""
-    try:
-        with pdfplumber.open(uploaded_file) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text: text_content += text + "\n"
-    except Exception as e:
-        return ""
-    return text_content
-
-def parse_document_data(text):
-    data = {}
-    
-    # --- 1. KEYWORD SEARCH (Global Check) ---
-    temp_keyword_pattern = r'(temporary\s*registration|temp\s*regn)'
-    has_temp_keyword = bool(re.search(temp_keyword_pattern, text, re.IGNORECASE))
-
-    # --- 2. FIND VEHICLE NUMBER ---
-    perm_pattern = r'\b[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}\b'
-    bh_pattern = r'\b[0-9]{2}BH[0-9]{4}[A-Z]{1,2}\b'
-    
-    veh_match = re.search(perm_pattern, text) or re.search(bh_pattern, text)
-    
-    if veh_match:
-        data['vehicle_no'] = veh_match.group(0)
-        found_perm_number = True
-    else:
-        if "new" in text.lower():
-            data['vehicle_no'] = "NEW"
-        else:
-            data['vehicle_no'] = "Not Found"
-        found_perm_number = False
-
-    # --- 3. DETERMINE REGISTRATION TYPE ---
-    if found_perm_number:
-        data['reg_type'] = "Permanent"
-    elif data['vehicle_no'] == "NEW":
-        data['reg_type'] = "Permanent"
-    elif has_temp_keyword:
-        data['reg_type'] = "Temporary"
-    else:
-        data['reg_type'] = "Temporary"
-
-    # --- 4. FIND CHASSIS NO ---
-    chassis_match = re.search(r'\b[A-HJ-NPR-Z0-9]{17}\b', text)
-    data['doc_chassis'] = chassis_match.group(0) if chassis_match else None
-
-    # --- 5. FIND CUSTOMER NAME ---
-    name_match = re.search(r'(?:Received From|Customer Name|Name|Mr\.|Ms\.)[:\s\.]*([A-Za-z\s\.]+)', text, re.IGNORECASE)
-    if name_match:
-        raw_name = name_match.group(1).strip()
-        data['doc_name'] = " ".join(raw_name.split()[:4]) 
-    else:
-        data['doc_name'] = None
-
-    # --- 6. FIND DATES ---
-    numeric_pattern = r'\d{2}[-/]\d{2}[-/]\d{4}'
-    text_month_pattern = r'\d{1,2}[-\s][A-Za-z]{3}[-\s]\d{4}'
-    date_pattern = f'(?:{numeric_pattern}|{text_month_pattern})'
-    
-    reg_match = re.search(r'(?:Registration|Regn|Reg\.)\s*Date[:\s]*(' + date_pattern + ')', text, re.IGNORECASE)
-    data['reg_date_specific'] = reg_match.group(1) if reg_match else None
-
-    rec_match = re.search(r'Receipt\s*date[:\s]*(' + date_pattern + ')', text, re.IGNORECASE)
-    data['receipt_date_specific'] = rec_match.group(1) if rec_match else None
-
-    if not data['reg_date_specific'] and not data['receipt_date_specific']:
-        any_date = re.search(date_pattern, text)
-        data['fallback_date'] = any_date.group(0) if any_date else None
-    else:
-        data['fallback_date'] = None
-
-    return data
-
-def analyze_row(row, doc_data, df_docs_all):
-    # Safe extractor for Row Series (handles duplicates)
-    def get_val(col_name):
-        val = row.get(col_name)
-        if isinstance(val, pd.Series):
-            return val.iloc[0]
-        return val
-
-    excel_name = get_val('Customer Name')
-    excel_chassis = get_val('Chassis number')
-
-    # 0. CHECK IF PROCESSING FAILED
-    if not doc_data.get('doc_chassis'):
-        # Secondary Lookup: Name Match / Chassis Mismatch
-        if excel_name and not df_docs_all.empty:
-            for _, doc_row in df_docs_all.iterrows():
-                if check_name_match(excel_name, doc_row['doc_name']):
-                    return ("Inconclusive Documentation provided - RTO challan/VAHAN screenshot/Tax paid receipt attached is incorrect", 
-                            "Hold", "NAME MATCH / CHASSIS MISMATCH")
-        
-        return "Please verify manually", "Pending", "NO DOCUMENT FOUND"
-
-    # --- PRIMARY CHECK ---
-    chassis_match = True 
-    name_is_match = check_name_match(excel_name, doc_data.get('doc_name'))
-    is_permanent = doc_data['reg_type'] == "Permanent"
-
-    # 1. APPROVED
-    if chassis_match and name_is_match and is_permanent:
-        return "Approved", "Approve", "None"
-
-    # 2. TEMP REG
-    if chassis_match and name_is_match and not is_permanent:
-        return ("Incomplete Documentation provided - RTO challan/VAHAN screenshot/Tax paid receipt is not attached.", 
-                "Hold", "TEMP REGISTRATION")
-
-    # 3. NAME MISMATCH
-    if chassis_match and not name_is_match:
-        return ("Inconclusive Documentation provided - RTO challan/VAHAN screenshot/Tax paid receipt attached is incorrect", 
-                "Hold", "NAME MISMATCH")
-
-    return "Please verify manually", "Pending", "UNKNOWN ERROR"
-
-def create_colored_excel(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Verification')
-    
-    output.seek(0)
-    wb = load_workbook(output)
-    ws = wb.active
-
-    green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    yellow_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-    blue_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")
-
-    header = {cell.value: i+1 for i, cell in enumerate(ws[1])}
-    status_col_idx = header.get('RTO status')
-
-    if status_col_idx:
-        for row in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row, column=status_col_idx)
-            val = str(cell.value).strip()
-            
-            if val == "Approve":
-                cell.fill = green_fill
-            elif val == "Hold":
-                cell.fill = yellow_fill
-            elif val == "Pending":
-                cell.fill = blue_fill
-    
-    output_final = io.BytesIO()
-    wb.save(output_final)
-    output_final.seek(0)
-    return output_final
-
-# --- STREAMLIT UI ---
-
-st.title("VW RTO Verification")
-st.markdown("Output strictly follows the order of the uploaded Excel file.")
-st.markdown("---") 
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.header("1. Upload Excel Data")
-    uploaded_excel = st.file_uploader("Upload your User Input Excel", type=["xlsx", "xls"])
-
-with col2:
-    st.header("2. Upload Documents")
-    uploaded_pdfs = st.file_uploader("Upload Document PDFs", type=["pdf"], accept_multiple_files=True)
-
-if st.button("🚀 Run Verification"):
-    if uploaded_excel and uploaded_pdfs:
-        with st.spinner("Processing Documents..."):
-            
-            # --- A. PROCESS PDFS ---
-            extracted_docs = []
-            progress_bar = st.progress(0)
-            
-            for i, pdf_file in enumerate(uploaded_pdfs):
-                text = extract_text_from_pdf_upload(pdf_file)
-                doc_info = parse_document_data(text)
-                if doc_info['doc_chassis']:
-                    extracted_docs.append(doc_info)
-                progress_bar.progress((i + 1) / len(uploaded_pdfs))
-            
-            df_docs = pd.DataFrame(extracted_docs)
-            st.success(f"Scanned {len(uploaded_pdfs)} files. Found valid data in {len(df_docs)} files.")
-
-            # --- B. LOAD USER EXCEL ---
-            try:
-                df_user = pd.read_excel(uploaded_excel)
-            except Exception as e:
-                st.error("❌ Error reading Excel file.")
-                st.stop()
-            
-            # --- STRICT CASE-INSENSITIVE COLUMN MATCHING ---
-            chassis_variations = ['chassis number', 'vin number']
-            chassis_col = find_column_case_insensitive(df_user.columns, chassis_variations)
-            
-            name_variations = ['customer name']
-            name_col = find_column_case_insensitive(df_user.columns, name_variations)
-
-            if not chassis_col or not name_col:
-                st.error(f"❌ Column Error. \n\nExpected 'Chassis Number' or 'VIN Number' AND 'Customer Name' (Case Insensitive). \n\nFound columns: {list(df_user.columns)}")
-                st.stop()
-            
-            # --- CLEAN COLUMNS ---
-            rename_map = {chassis_col: 'Chassis number', name_col: 'Customer Name'}
-            
-            for target in ['Chassis number', 'Customer Name']:
-                if target in df_user.columns and target not in [chassis_col, name_col]:
-                    df_user = df_user.drop(columns=[target])
-            
-            df_user.rename(columns=rename_map, inplace=True)
-            df_user = df_user.loc[:, ~df_user.columns.duplicated()]
-
-            # --- C. MERGE ---
-            if not df_docs.empty:
-                df_user['Chassis number'] = df_user['Chassis number'].astype(str).str.strip()
-                df_docs['doc_chassis'] = df_docs['doc_chassis'].astype(str).str.strip()
-                merged_df = pd.merge(df_user, df_docs, left_on='Chassis number', right_on='doc_chassis', how='left')
-            else:
-                merged_df = df_user.copy()
-                merged_df['doc_chassis'] = None
-
-            # --- D. ANALYZE ---
-            results = []
-            for index, row in merged_df.iterrows():
-                
-                doc_data = {
-                    'doc_name': row.get('doc_name'),
-                    'doc_chassis': row.get('doc_chassis'),
-                    'reg_type': row.get('reg_type'),
-                    'vehicle_no': row.get('vehicle_no', "Not Found")
-                }
-                
-                # --- DATE LOGIC ---
-                reg_date = row.get('reg_date_specific')
-                receipt_date = row.get('receipt_date_specific')
-                fallback_date = row.get('fallback_date')
-
-                if reg_date and str(reg_date).strip():
-                    final_reg_date = reg_date
-                elif receipt_date and str(receipt_date).strip():
-                    final_reg_date = receipt_date
-                else:
-                    final_reg_date = fallback_date
-
-                remark, status, error_type = analyze_row(row, doc_data, df_docs)
-                
-                output_row = row.to_dict()
-                
-                for k, v in output_row.items():
-                    if isinstance(v, pd.Series):
-                        output_row[k] = v.iloc[0]
-
-                for key in ['doc_name', 'doc_chassis', 'reg_type', 'vehicle_no', 
-                           'reg_date_specific', 'receipt_date_specific', 'fallback_date']:
-                    if key in output_row: del output_row[key]
-
-                output_row['Verification Date'] = final_reg_date
-                output_row['Doc Vehicle Num'] = doc_data['vehicle_no']
-                output_row['RTO status'] = status
-                output_row['Specific Error'] = error_type
-                output_row['Remarks'] = remark
-                
-                results.append(output_row)
-
-            final_df = pd.DataFrame(results)
-
-            # Reorder with Specific Error column included
-            cols = list(final_df.columns)
-            priority = ['Chassis number', 'Customer Name', 'RTO status', 'Specific Error', 'Remarks']
-            new_order = priority + [c for c in cols if c not in priority]
-            final_df = final_df[new_order]
-
-            st.write("### Verification Results")
-            st.dataframe(final_df)
-
-            processed_excel = create_colored_excel(final_df)
-            
-            st.download_button(
-                label="📥 Download Colored Excel Report",
-                data=processed_excel,
-                file_name="verification_report.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-    else:
-        st.error("Please upload both the Excel file and the PDF documents.")
+import streamlit as st
+import pandas as pd
+import numpy as np
+import re
+import io
+import os
+import string
+import hashlib
+import zipfile
+import functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+from rapidfuzz import fuzz, process
+
+# --- PAGE CONFIG ---
+st.set_page_config(page_title="VW RTO Verifier", layout="wide")
+
+# --- COMPILED PATTERNS (built once at import, reused for every PDF) ---
+
+NAME_RE = re.compile(r'(?:Received From|Customer Name|Name|Mr\.|Ms\.)[:\s\.]*([A-Za-z\s\.]+)', re.IGNORECASE)
+
+# Punctuation-to-space table for name normalization; str.translate runs
+# a single C loop with no pattern engine involved.
+PUNCT_TO_SPACE = str.maketrans({c: ' ' for c in string.punctuation})
+
+_DATE_PATTERN = r'(?:\d{2}[-/]\d{2}[-/]\d{4}|\d{1,2}[-\s][A-Za-z]{3}[-\s]\d{4})'
+
+# Single-pass page scan for the early-exit check: chassis, the name
+# label, the markers that settle the registration type (plate, temp
+# keyword or "new") and any date share one alternation so each page is
+# walked once instead of once per pattern.
+PAGE_SCAN_RE = re.compile(
+    r'(?P<chassis>\b[A-HJ-NPR-Z0-9]{17}\b)'
+    r'|(?P<veh>\b(?:[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}|[0-9]{2}BH[0-9]{4}[A-Z]{1,2})\b)'
+    r'|(?P<name>(?i:Received From|Customer Name|Name|Mr\.|Ms\.))'
+    r'|(?P<regtype>(?i:temporary\s*registration|temp\s*regn|new))'
+    r'|(?P<date>' + _DATE_PATTERN + r')'
+)
+
+# Field extraction runs as one linear scan per document: every pattern
+# shares a single alternation and finditer dispatches on lastgroup.
+# Case-insensitivity is scoped to the literal labels so the plate and
+# chassis character classes stay exact. Labeled dates come before the
+# bare date alternative so they are classified, not swallowed.
+# The customer-name pattern stays separate because it captures the
+# free-form text that follows its label.
+MASTER_RE = re.compile(
+    r'(?P<veh>\b(?:[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}|[0-9]{2}BH[0-9]{4}[A-Z]{1,2})\b)'
+    r'|(?P<chassis>\b[A-HJ-NPR-Z0-9]{17}\b)'
+    r'|(?i:(?:Registration|Regn|Reg\.)\s*Date[:\s]*)(?P<regdate>' + _DATE_PATTERN + r')'
+    r'|(?i:Receipt\s*date[:\s]*)(?P<recdate>' + _DATE_PATTERN + r')'
+    r'|(?P<anydate>' + _DATE_PATTERN + r')'
+    r'|(?P<new>(?i:new))'
+)
+
+# --- HELPER FUNCTIONS ---
+
+def normalize_text(text):
+    if not text: return ""
+    return str(text).translate(PUNCT_TO_SPACE).lower().strip()
+
+# Minimum rapidfuzz token_set_ratio score for two names to count as a match
+NAME_SCORE_CUTOFF = 50
+
+@functools.lru_cache(maxsize=8192)
+def normalize_name(value):
+    # The same names show up over and over (one per merge row, plus the
+    # secondary lookup), so normalization is memoized; the name domain
+    # is tiny relative to call count.
+    return normalize_text(value)
+
+def normalize_names(series):
+    # Normalize a Series of names via the memoized scalar helper so
+    # duplicates are free
+    return series.fillna('').astype(str).map(normalize_name)
+
+def check_name_match(excel_name, doc_name):
+    if not doc_name or not excel_name:
+        return False
+    return fuzz.token_set_ratio(normalize_name(str(excel_name)), normalize_name(str(doc_name)),
+                                score_cutoff=NAME_SCORE_CUTOFF) >= NAME_SCORE_CUTOFF
+
+# The chassis/name/plate fields sit on the first page or two; scanned
+# multi-page bundles are capped instead of being read end-to-end.
+MAX_PDF_PAGES = 10
+
+def extract_text_from_pdf_upload(uploaded_file):
+    # pypdfium2 wraps a C core and is much faster than pdfplumber for
+    # plain text extraction, which is all this app needs. Pages are read
+    # one at a time and reading stops as soon as the text already
+    # carries everything the parser looks for: the chassis, a name, and
+    # either a vehicle number or the temp-registration keyword.
+    # Imported here, not at module top: widget-change reruns skip the
+    # native library load, which only the parse workers need.
+    import pypdfium2 as pdfium
+    try:
+        pdf = pdfium.PdfDocument(uploaded_file)
+        try:
+            parts = []
+            has_chassis = has_name = has_reg_type = has_date = False
+            for i in range(min(len(pdf), MAX_PDF_PAGES)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                parts.append(page_text)
+                for m in PAGE_SCAN_RE.finditer(page_text):
+                    kind = m.lastgroup
+                    if kind == 'chassis':
+                        has_chassis = True
+                    elif kind == 'name':
+                        has_name = True
+                    elif kind == 'date':
+                        has_date = True
+                    else:
+                        has_reg_type = True
+                    if has_chassis and has_name and has_reg_type and has_date:
+                        break
+                if has_chassis and has_name and has_reg_type and has_date:
+                    break
+            return "\n".join(parts)
+        finally:
+            pdf.close()
+    except Exception as e:
+        return ""
+
+def parse_document_data(text):
+    """
+    Field extraction for one document: a single MASTER_RE finditer walk
+    collects the first hit per field, then the fields are assembled.
+    """
+    found = {}
+    has_new = False
+    for m in MASTER_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == 'new':
+            has_new = True
+        elif kind not in found:
+            found[kind] = m.group(kind)
+
+    data = {}
+
+    # --- 1. VEHICLE NUMBER + REGISTRATION TYPE ---
+    veh = found.get('veh')
+    data['vehicle_no'] = veh if veh else ("NEW" if has_new else "Not Found")
+    # A found plate or a brand-new vehicle counts as Permanent;
+    # everything else is Temporary
+    data['reg_type'] = "Permanent" if (veh or has_new) else "Temporary"
+
+    # --- 2. CHASSIS NO ---
+    data['doc_chassis'] = found.get('chassis')
+
+    # --- 3. CUSTOMER NAME (first four words after the label) ---
+    name_match = NAME_RE.search(text)
+    data['doc_name'] = " ".join(name_match.group(1).strip().split()[:4]) if name_match else None
+
+    # --- 4. DATES ---
+    data['reg_date_specific'] = found.get('regdate')
+    data['receipt_date_specific'] = found.get('recdate')
+    if not data['reg_date_specific'] and not data['receipt_date_specific']:
+        data['fallback_date'] = found.get('anydate')
+    else:
+        data['fallback_date'] = None
+
+    return data
+
+def process_pdf(pdf_bytes):
+    # Worker for the process pool: takes raw PDF bytes so it is picklable.
+    return parse_document_data(extract_text_from_pdf_upload(io.BytesIO(pdf_bytes)))
+
+def parse_pdfs_cached(pdf_blobs, progress=None):
+    # Per-file memo keyed on content hash, kept in session state so a
+    # rerun only parses the files that actually changed. The memo sits
+    # in front of the process pool (a per-file @st.cache_data wrapper
+    # would force cache misses to parse serially inside the decorator).
+    cache = st.session_state.setdefault('_pdf_doc_cache', {})
+    digests = [hashlib.sha1(blob).digest() for blob in pdf_blobs]
+    pending = [(i, blob) for i, (blob, digest) in enumerate(zip(pdf_blobs, digests))
+               if digest not in cache]
+
+    done = len(pdf_blobs) - len(pending)
+    if progress is not None:
+        progress.progress(done / len(pdf_blobs))
+
+    if len(pending) == 1:
+        # Not worth spawning worker processes for a single file
+        i, blob = pending[0]
+        cache[digests[i]] = process_pdf(blob)
+        if progress is not None:
+            progress.progress(1.0)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {executor.submit(process_pdf, blob): i for i, blob in pending}
+            for future in as_completed(futures):
+                cache[digests[futures[future]]] = future.result()
+                done += 1
+                if progress is not None:
+                    progress.progress(done / len(pdf_blobs))
+
+    return [cache[digest] for digest in digests]
+
+@st.cache_data(show_spinner=False)
+def load_user_excel(excel_bytes):
+    # Keyed on the upload's bytes, so Excel parsing survives reruns too.
+    # Read-only openpyxl streams the sheet without building the style/merge
+    # caches pd.read_excel would; legacy .xls (no ZIP magic) falls back.
+    if not excel_bytes.startswith(b'PK\x03\x04'):
+        return pd.read_excel(io.BytesIO(excel_bytes))
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(excel_bytes), read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        return pd.DataFrame(rows, columns=list(header))
+    finally:
+        wb.close()
+
+# Highly repetitive label columns from the dealer Excel; stored as
+# category dtype so large sheets compare/merge on integer codes.
+CATEGORY_COLUMNS = ['Dealer code', 'Dealer name', 'Model', 'Variant description', 'Vehicle status', 'MY', 'VY']
+
+# Accepted header spellings per required column, in priority order.
+# New identity columns only need an entry here.
+COLUMN_KEYWORDS = {
+    'Chassis number': ('chassis number', 'vin number'),
+    'Customer Name': ('customer name',),
+}
+
+# The downloadable report is emitted as raw ZIP+XML: the container
+# parts below are fixed, and the worksheet streams rows with inline
+# strings (no shared-strings table). Styles 1-3 in cellXfs are the
+# green/yellow/blue solid fills for the status column.
+STATUS_STYLE = {"Approve": 1, "Hold": 2, "Pending": 3}
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Verification" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="5">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFC6EFCE"/><bgColor rgb="FFC6EFCE"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFFFEB9C"/><bgColor rgb="FFFFEB9C"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFBDD7EE"/><bgColor rgb="FFBDD7EE"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="3" borderId="0" xfId="0" applyFill="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="4" borderId="0" xfId="0" applyFill="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+
+_XLSX_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+def _col_letter(idx):
+    # 1-based column index -> Excel column letters
+    letters = ''
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+REMARK_TEMP_REG = "Incomplete Documentation provided - RTO challan/VAHAN screenshot/Tax paid receipt is not attached."
+REMARK_MISMATCH = "Inconclusive Documentation provided - RTO challan/VAHAN screenshot/Tax paid receipt attached is incorrect"
+REMARK_MANUAL = "Please verify manually"
+
+def blank_to_na(series):
+    # Whitespace-only values behave like missing ones in fallback chains
+    return series.where(series.fillna('').astype(str).str.strip().astype(bool))
+
+def analyze_frame(merged_df, df_docs_all):
+    """
+    Vectorized analysis of the merged frame.
+    Returns (remarks, statuses, errors) arrays aligned with merged_df.
+    """
+    # Normalize each name column once; scoring then runs in rapidfuzz's
+    # compiled token_set_ratio rather than interpreted token loops.
+    excel_norm = normalize_names(merged_df['Customer Name'])
+    doc_norm = normalize_names(merged_df['doc_name'])
+
+    has_chassis = merged_df['doc_chassis'].notna().to_numpy()
+    name_ok = np.array([
+        bool(e) and bool(d) and fuzz.token_set_ratio(e, d, score_cutoff=NAME_SCORE_CUTOFF) >= NAME_SCORE_CUTOFF
+        for e, d in zip(excel_norm, doc_norm)
+    ], dtype=bool)
+    is_permanent = merged_df['reg_type'].eq('Permanent').fillna(False).to_numpy()
+
+    # Secondary Lookup for rows with no matching document: does any
+    # scanned doc carry this customer's name? One cdist call scores the
+    # whole unmatched-rows x docs matrix in rapidfuzz's C threads.
+    name_hit_any = np.zeros(len(merged_df), dtype=bool)
+    if not df_docs_all.empty:
+        unmatched = ~has_chassis & np.array([bool(e) for e in excel_norm], dtype=bool)
+        if unmatched.any():
+            all_doc_names = normalize_names(df_docs_all['doc_name']).tolist()
+            scores = process.cdist(excel_norm[unmatched].tolist(), all_doc_names,
+                                   scorer=fuzz.token_set_ratio,
+                                   score_cutoff=NAME_SCORE_CUTOFF, workers=-1)
+            name_hit_any[unmatched] = scores.max(axis=1) >= NAME_SCORE_CUTOFF
+
+    conditions = [
+        has_chassis & name_ok & is_permanent,
+        has_chassis & name_ok & ~is_permanent,
+        has_chassis & ~name_ok,
+        ~has_chassis & name_hit_any,
+        ~has_chassis,
+    ]
+    remarks = np.select(conditions,
+                        ["Approved", REMARK_TEMP_REG, REMARK_MISMATCH, REMARK_MISMATCH, REMARK_MANUAL],
+                        default=REMARK_MANUAL)
+    statuses = np.select(conditions,
+                         ["Approve", "Hold", "Hold", "Hold", "Pending"],
+                         default="Pending")
+    errors = np.select(conditions,
+                       ["None", "TEMP REGISTRATION", "NAME MISMATCH", "NAME MATCH / CHASSIS MISMATCH", "NO DOCUMENT FOUND"],
+                       default="UNKNOWN ERROR")
+    return remarks, statuses, errors
+
+def _cell_xml(row_ref, col_idx, value, style):
+    ref = f'{_col_letter(col_idx)}{row_ref}'
+    if value is None or pd.isna(value):
+        return f'<c r="{ref}" s="{style}"/>'
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return f'<c r="{ref}" s="{style}"><v>{value}</v></c>'
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+def create_colored_excel(df):
+    # Emit the .xlsx ZIP directly: a string-building pass over the rows
+    # plus one deflate, with no per-cell workbook objects in between.
+    columns = list(df.columns)
+    status_pos = columns.index('RTO status') if 'RTO status' in columns else None
+
+    rows = ['<row r="1">'
+            + ''.join(_cell_xml(1, j, col, 0) for j, col in enumerate(columns, start=1))
+            + '</row>']
+    for i, values in enumerate(df.itertuples(index=False, name=None), start=2):
+        status_style = 0
+        if status_pos is not None:
+            status_style = STATUS_STYLE.get(str(values[status_pos]).strip(), 0)
+        cells = [_cell_xml(i, j, v, status_style if (status_pos is not None and j == status_pos + 1) else 0)
+                 for j, v in enumerate(values, start=1)]
+        rows.append(f'<row r="{i}">' + ''.join(cells) + '</row>')
+
+    sheet_xml = _XLSX_SHEET_HEADER + ''.join(rows) + '</sheetData></worksheet>'
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _XLSX_STYLES)
+        zf.writestr('xl/worksheets/sheet1.xml', sheet_xml)
+    output.seek(0)
+    return output
+
+# --- STREAMLIT UI ---
+
+st.title("VW RTO Verification")
+st.markdown("Output strictly follows the order of the uploaded Excel file.")
+st.markdown("---") 
+
+col1, col2 = st.columns(2)
+
+with col1:
+    st.header("1. Upload Excel Data")
+    uploaded_excel = st.file_uploader("Upload your User Input Excel", type=["xlsx", "xls"])
+
+with col2:
+    st.header("2. Upload Documents")
+    uploaded_pdfs = st.file_uploader("Upload Document PDFs", type=["pdf"], accept_multiple_files=True)
+
+if st.button("🚀 Run Verification"):
+    if uploaded_excel and uploaded_pdfs:
+        with st.spinner("Processing Documents..."):
+            
+            # --- A. PROCESS PDFS (PARALLEL, ONE WORKER PER CORE) ---
+            progress_bar = st.progress(0)
+
+            # Read each upload once in the main process; workers get raw bytes.
+            pdf_blobs = tuple(pdf_file.getvalue() for pdf_file in uploaded_pdfs)
+
+            doc_list = parse_pdfs_cached(pdf_blobs, progress=progress_bar)
+
+            # Upload order is preserved; keep only docs with a chassis hit
+            df_docs = pd.DataFrame(doc_list)
+            df_docs = df_docs[df_docs['doc_chassis'].notna()].reset_index(drop=True)
+            st.success(f"Scanned {len(uploaded_pdfs)} files. Found valid data in {len(df_docs)} files.")
+
+            # --- B. LOAD USER EXCEL ---
+            try:
+                df_user = load_user_excel(uploaded_excel.getvalue())
+            except Exception as e:
+                st.error("❌ Error reading Excel file.")
+                st.stop()
+
+            for cat_col in CATEGORY_COLUMNS:
+                if cat_col in df_user.columns:
+                    df_user[cat_col] = df_user[cat_col].astype('category')
+
+            # --- STRICT CASE-INSENSITIVE COLUMN MATCHING ---
+            # Normalize every column name once, then resolve each target
+            # by dict lookup (setdefault keeps the first column when
+            # names collide). One pass over the sheet's columns covers
+            # every keyword group, however many get added.
+            col_map = {}
+            for c in df_user.columns:
+                col_map.setdefault(str(c).lower().strip(), c)
+
+            resolved = {
+                target: next((col_map[k] for k in keywords if k in col_map), None)
+                for target, keywords in COLUMN_KEYWORDS.items()
+            }
+            chassis_col = resolved['Chassis number']
+            name_col = resolved['Customer Name']
+
+            if not chassis_col or not name_col:
+                st.error(f"❌ Column Error. \n\nExpected 'Chassis Number' or 'VIN Number' AND 'Customer Name' (Case Insensitive). \n\nFound columns: {list(df_user.columns)}")
+                st.stop()
+            
+            # --- CLEAN COLUMNS ---
+            rename_map = {chassis_col: 'Chassis number', name_col: 'Customer Name'}
+            
+            for target in ['Chassis number', 'Customer Name']:
+                if target in df_user.columns and target not in [chassis_col, name_col]:
+                    df_user = df_user.drop(columns=[target])
+            
+            df_user.rename(columns=rename_map, inplace=True)
+            df_user = df_user.loc[:, ~df_user.columns.duplicated()]
+
+            # Normalize the join key exactly once; everything downstream
+            # compares already-stripped uppercase strings. Arrow-backed
+            # string dtype keeps strip/upper in C instead of per-object
+            # Python calls.
+            df_user['Chassis number'] = df_user['Chassis number'].astype('string[pyarrow]').str.strip().str.upper()
+            df_user['Customer Name'] = df_user['Customer Name'].astype('string[pyarrow]')
+
+            # --- C. DOC LOOKUP ---
+            # Hash-based: a dict keyed on chassis replaces pd.merge. One
+            # doc per chassis is kept (first wins), so a duplicate
+            # chassis across PDFs can no longer fan a sheet row out into
+            # several result rows the way the old left-merge could.
+            if not df_docs.empty:
+                df_docs['doc_chassis'] = df_docs['doc_chassis'].astype('string[pyarrow]').str.strip().str.upper()
+                df_docs['reg_type'] = df_docs['reg_type'].astype('category')
+                doc_by_chassis = (df_docs.drop_duplicates('doc_chassis')
+                                         .set_index('doc_chassis').to_dict('index'))
+                merged_df = df_user.copy()
+                matched = df_user['Chassis number'].map(doc_by_chassis.get)
+                merged_df['doc_chassis'] = df_user['Chassis number'].where(matched.notna())
+                for doc_col in ['doc_name', 'reg_type', 'vehicle_no',
+                                'reg_date_specific', 'receipt_date_specific', 'fallback_date']:
+                    merged_df[doc_col] = matched.map(lambda d, c=doc_col: d.get(c) if isinstance(d, dict) else None)
+            else:
+                merged_df = df_user.copy()
+                for doc_col in ['doc_chassis', 'doc_name', 'reg_type', 'vehicle_no',
+                                'reg_date_specific', 'receipt_date_specific', 'fallback_date']:
+                    merged_df[doc_col] = None
+
+            # --- D. ANALYZE (VECTORIZED) ---
+            remarks_arr, statuses_arr, errors_arr = analyze_frame(merged_df, df_docs)
+
+            # --- DATE LOGIC (registration date, else receipt date, else fallback) ---
+            merged_df['Verification Date'] = (blank_to_na(merged_df['reg_date_specific'])
+                                              .fillna(blank_to_na(merged_df['receipt_date_specific']))
+                                              .fillna(merged_df['fallback_date']))
+            merged_df['Doc Vehicle Num'] = merged_df['vehicle_no'].fillna("Not Found")
+            merged_df['RTO status'] = statuses_arr
+            merged_df['Specific Error'] = errors_arr
+            merged_df['Remarks'] = remarks_arr
+
+            final_df = merged_df.drop(columns=['doc_name', 'doc_chassis', 'reg_type', 'vehicle_no',
+                                               'reg_date_specific', 'receipt_date_specific', 'fallback_date'],
+                                      errors='ignore')
+
+            # Reorder with Specific Error column included
+            priority = ['Chassis number', 'Customer Name', 'RTO status', 'Specific Error', 'Remarks']
+            final_df = final_df[priority + [c for c in final_df.columns if c not in priority]]
+
+            st.write("### Verification Results")
+            st.dataframe(final_df)
+
+            processed_excel = create_colored_excel(final_df)
+            
+            st.download_button(
+                label="📥 Download Colored Excel Report",
+                data=processed_excel,
+                file_name="verification_report.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+    else:
+        st.error("Please upload both the Excel file and the PDF documents.")